@@ -4,6 +4,7 @@ import time
 import typing
 
 import click
+import numpy as np
 import pandas as pd
 
 import srt_utils.process as process
@@ -14,6 +15,12 @@ logger = logging.getLogger(__name__)
 
 PAYLOAD_SIZE = 1316
 MAXIMUM_SEQUENCE_NUMBER = 2 ** 32
+# Number of sequence numbers processed at once by the receive buffer
+# simulation, bounds the size of temporary arrays for large captures
+SIMULATION_CHUNK_SIZE = 2 ** 22
+# Maximum sequence number span of a capture supported by the receive
+# buffer simulation, bounds the size of dense per-sequence-number arrays
+SIMULATION_MAX_SPAN = 2 ** 28
 
 
 def _nodes_split(ctx, param, value):
@@ -310,6 +317,7 @@ def start_receiver(args, interval_s, k):
         # for checking the possibility of receiving duplicate packets.
         for i in range(1, k + 1):
             received_packet = read_data(proc, interval_s)
+            dst_time = time.monotonic()
             src_byte = received_packet[:4]
             s = int.from_bytes(src_byte, byteorder='big')
             logger.debug(f'Received packet {s}')
@@ -346,6 +354,7 @@ def start_receiver(args, interval_s, k):
                 'NextExp': previous_next_exp,
                 'SrcByte (hex)': src_byte,
                 'Dst Order': i,
+                'Dst Time (s)': dst_time,
                 'Type-P-Reordered': type_p_reordered,
                 'Seq Disc': seq_discontinuty,
                 'Seq Disc Size': seq_discontinuty_size,
@@ -373,6 +382,130 @@ def start_receiver(args, interval_s, k):
         calculate_print_metrics(df, k)
 
 
+def simulate_receive_buffer(seqs: np.ndarray, times_s: np.ndarray, latencies_ms):
+    """
+    Replay captured arrivals through virtual receive buffers of several
+    candidate latency windows and estimate the effect of each window.
+    For every sequence number s the reference time is the arrival time of
+    the first packet that moved NextExp beyond s, i.e. the moment packet s
+    became either in-order (s itself arrived) or missing (a sequence
+    discontinuity covering s was detected). A buffer with latency window W
+    holds packets until all the preceding ones have arrived or until
+    reference time + W has passed. Packets arriving after that deadline
+    are dropped as too late the same way SRT drops them, so the buffer
+    output is always in order. Packets are delivered in sequence order,
+    so a packet waits for the slowest of its predecessors.
+    All the windows share the classification pass over the capture,
+    each window is then evaluated by vectorized operations over chunks
+    of `SIMULATION_CHUNK_SIZE` sequence numbers.
+    Attributes:
+        seqs:
+            Packet sequence numbers in the order of arrival, possibly
+            containing duplicates (only the first copy is considered),
+        times_s:
+            Arrival times of the packets, in seconds,
+        latencies_ms:
+            Candidate latency windows, in milliseconds.
+    Returns `pd.DataFrame` with one row of metrics per latency window.
+    """
+    seqs = np.asarray(seqs, dtype=np.int64)
+    times_s = np.asarray(times_s, dtype=np.float64)
+    windows = np.asarray(latencies_ms, dtype=np.float64) / 1000
+    if len(seqs) == 0:
+        raise ValueError('No packets in capture')
+    if len(seqs) != len(times_s):
+        raise ValueError('Sequence numbers and arrival times differ in length')
+    if not np.isfinite(times_s).all():
+        raise ValueError('Arrival times contain NaN or infinite values')
+    if not np.all(np.diff(times_s) >= 0):
+        raise ValueError(
+            'Arrival times are decreasing, rows are expected in the order of arrival'
+        )
+    if not np.all(windows >= 0):
+        raise ValueError('Latency windows must be non-negative')
+    n = len(seqs)
+
+    # Index of the first copy of every received sequence number, sorted
+    # by sequence number; further copies are duplicates
+    uniq, first_idx = np.unique(seqs, return_index=True)
+    base = uniq[0]
+    size = int(uniq[-1] - base + 1)
+    # Sequence numbers are not unwrapped, so a wrap-around or an outlier
+    # would make both the dense arrays and NextExp classification wrong
+    if size > SIMULATION_MAX_SPAN:
+        raise ValueError(
+            f'Sequence number span {size} exceeds the maximum of '
+            f'{SIMULATION_MAX_SPAN} supported by the simulation, the capture '
+            'may contain wrapped sequence numbers or outliers'
+        )
+    # Dense arrival order per sequence number, n stands for "never arrived"
+    dst_order = np.full(size, n, dtype=np.int64)
+    dst_order[uniq - base] = first_idx
+    del uniq, first_idx
+    # NextExp - 1 after each arrival is the running maximum of sequence
+    # numbers, so the arrival that moved NextExp beyond s is the first one
+    # with the running maximum >= s
+    max_seq = np.maximum.accumulate(seqs)
+    times_ext = np.append(times_s, np.inf)
+
+    received_total = 0
+    reordered_total = 0
+    late_drops = np.zeros(len(windows), dtype=np.int64)
+    delay_sum = np.zeros(len(windows))
+    delay_max = np.zeros(len(windows))
+    # Release time of the last packet of the previous chunk per window
+    carry = np.full(len(windows), -np.inf)
+
+    for start in range(0, size, SIMULATION_CHUNK_SIZE):
+        stop = min(start + SIMULATION_CHUNK_SIZE, size)
+        order = dst_order[start:stop]
+        ref = np.searchsorted(
+            max_seq,
+            np.arange(base + start, base + stop, dtype=np.int64),
+            side='left'
+        )
+        # Type-P-Reordered: the packet arrived after NextExp moved beyond it
+        received = order < n
+        received_total += int(received.sum())
+        reordered_total += int((order[received] > ref[received]).sum())
+        arrival = times_ext[order]
+        ref_time = times_s[ref]
+
+        for j, window in enumerate(windows):
+            deadline = ref_time + window
+            # The buffer stops waiting for a packet once it either arrives
+            # or its deadline expires
+            ready = np.minimum(arrival, deadline)
+            release = np.maximum.accumulate(ready)
+            np.maximum(release, carry[j], out=release)
+            carry[j] = release[-1]
+            delivered = arrival <= deadline
+            late_drops[j] += int(received.sum() - delivered.sum())
+            delay = release[delivered] - arrival[delivered]
+            if len(delay) > 0:
+                delay_sum[j] += delay.sum()
+                delay_max[j] = max(delay_max[j], delay.max())
+
+    delivered_total = received_total - late_drops
+    mean_delay = np.divide(
+        delay_sum,
+        delivered_total,
+        out=np.zeros(len(windows)),
+        where=delivered_total > 0
+    )
+
+    return pd.DataFrame({
+        'Latency, ms': latencies_ms,
+        'Packets Received': received_total,
+        'Packets Reordered': reordered_total,
+        'Reordered Recovered': reordered_total - late_drops,
+        'Late Drops': late_drops,
+        'Late Drops Ratio, %': np.round(late_drops / received_total * 100, 4),
+        'Mean Added Delay, ms': np.round(mean_delay * 1000, 3),
+        'Max Added Delay, ms': np.round(delay_max * 1000, 3),
+    })
+
+
 @click.group()
 @click.option(
     '--debug/--no-debug',
@@ -659,5 +792,61 @@ def re_receiver(port, duration, n, bitrate, attrs, ll, lfa, lf, path):
     start_receiver(args, interval, n)
 
 
+@cli.command()
+@click.option(
+    '--latency',
+    help='Candidate latency window, ms, multiple windows can be defined',
+    type=click.FloatRange(min=0),
+    default=(20, 40, 60, 80, 120, 200, 300, 500, 1000),
+    multiple=True,
+    show_default=True
+)
+@click.option(
+    '--seq-col',
+    default='s@Dst',
+    help='Name of the column with packet sequence numbers',
+    show_default=True
+)
+@click.option(
+    '--time-col',
+    default='Dst Time (s)',
+    help='Name of the column with packet arrival times, s',
+    show_default=True
+)
+@click.argument(
+    'path',
+    type=click.Path(exists=True)
+)
+def simulate(latency, seq_col, time_col, path):
+    # Offline what-if analysis of a receiver capture, e.g.
+    # packets_duplicates.csv, rows are expected in the order of arrival
+    logger.info(f'Reading capture: {path}')
+    try:
+        df = pd.read_csv(
+            path,
+            usecols=[seq_col, time_col],
+            dtype={seq_col: np.int64, time_col: np.float64}
+        )
+        if len(df.index) == 0:
+            logger.info('No packets in capture')
+            return
+
+        logger.info(f'Simulating receive buffer for {len(df.index)} packets')
+        df_stats = simulate_receive_buffer(
+            df[seq_col].to_numpy(),
+            df[time_col].to_numpy(),
+            list(latency)
+        )
+    except ValueError as e:
+        logger.error(e)
+        return
+    print(df_stats.to_string(index=False))
+    print('\n')
+
+    logger.info('Writing results to buffer_simulation.csv')
+    df_stats.to_csv('buffer_simulation.csv', index=False)
+    logger.info('Writing to .csv is finished')
+
+
 if __name__ == '__main__':
     cli()